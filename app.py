@@ -1,10 +1,14 @@
 import streamlit as st
 import pandas as pd
-import json
+import orjson
 from pathlib import Path
 from datetime import datetime
 import time
 import logging
+import sys
+import threading
+from collections import deque
+from typing import NamedTuple
 
 # Configure logging
 logging.basicConfig(
@@ -17,17 +21,11 @@ logging.basicConfig(
 )
 
 LEDGER = Path('data/ledger.json')
-
-# Initialize session state
-if 'last_reset' not in st.session_state:
-    st.session_state['last_reset'] = time.time()
-if 'auto_refresh' not in st.session_state:
-    st.session_state['auto_refresh'] = True
-
-st.set_page_config(page_title="FL Audit Dashboard", layout="wide", initial_sidebar_state="collapsed")
+LEDGER_WINDOW = 100  # Rounds kept in memory; covers the largest rounds_to_show
+REFRESH_INTERVAL = 5  # Seconds between dashboard refreshes
 
 # Custom CSS for modern look
-st.markdown("""
+CSS = """
     <style>
         .stButton > button {
             background-color: #4CAF50;
@@ -49,11 +47,20 @@ st.markdown("""
         .metric-card label {
             color: #E0E0E0 !important;
         }
-        [data-testid="stMetricValue"] > div {
+        .kpi-grid {
+            display: grid;
+            grid-template-columns: repeat(4, 1fr);
+            gap: 1rem;
+        }
+        .kpi-label {
+            color: #E0E0E0 !important;
+            font-size: 0.875rem;
+        }
+        .kpi-value {
             color: #4CAF50 !important;
             font-size: 2rem !important;
         }
-        [data-testid="stMetricDelta"] > div {
+        .kpi-delta {
             color: #64B5F6 !important;
         }
         .css-1v0mbdj.e115fcil1 {
@@ -69,7 +76,18 @@ st.markdown("""
             color: #424242;
         }
     </style>
-""", unsafe_allow_html=True)
+"""
+
+# Initialize session state
+if 'last_reset' not in st.session_state:
+    st.session_state['last_reset'] = time.time()
+if 'auto_refresh' not in st.session_state:
+    st.session_state['auto_refresh'] = True
+
+st.set_page_config(page_title="FL Audit Dashboard", layout="wide", initial_sidebar_state="collapsed")
+
+# Custom CSS is injected once per full script run; fragment refreshes reuse it
+st.markdown(CSS, unsafe_allow_html=True)
 
 st.title("🔄 Federated Learning Audit Dashboard")
 st.markdown("**Real-time monitoring of federated learning rounds and node performance**")
@@ -80,53 +98,259 @@ def truncate_hash(hash_string, start_chars=8, end_chars=8):
         return f"{hash_string[:start_chars]}...{hash_string[-end_chars:]}"
     return hash_string
 
+def truncate_series(s, start_chars=8, end_chars=8):
+    """Vectorized truncate_hash for a whole column of hash strings."""
+    is_long = s.str.len() > start_chars + end_chars
+    return s.where(~is_long, s.str.slice(0, start_chars) + "..." + s.str.slice(-end_chars))
+
 def load_ledger():
-    if not LEDGER.exists():
+    try:
+        content = LEDGER.read_bytes()
+    except FileNotFoundError:
+        return []
+    # Handle empty file case
+    if not content:
         return []
     try:
-        with open(LEDGER, 'r') as f:
-            # Handle empty file case
-            content = f.read()
-            if not content:
-                return []
-            return json.loads(content)
-    except (json.JSONDecodeError, FileNotFoundError):
-        time.sleep(0.1)  # Wait briefly if file is being written or created
+        return orjson.loads(content)
+    except orjson.JSONDecodeError:
+        time.sleep(0.05)  # Wait briefly if file is being written
         try:
-            with open(LEDGER, 'r') as f:
-                content = f.read()
-                if not content:
-                    return []
-                return json.loads(content)
-        except (json.JSONDecodeError, FileNotFoundError):
+            return orjson.loads(LEDGER.read_bytes() or b'[]')
+        except (orjson.JSONDecodeError, FileNotFoundError):
             return []
 
 
-def ledger_to_df(ledger):
+def window_ledger(entries):
+    """Keeps the last LEDGER_WINDOW entries and collects every node UUID seen.
+
+    `entries` can be a generator, so only the window is ever held in memory.
+    Nodes are collected over the whole ledger so that a node ageing out of
+    the window does not shift the letters of the others.
+    """
+    recent = deque(maxlen=LEDGER_WINDOW)
+    node_ids = set()
+    for entry in entries:
+        node_ids.update(entry["node_accuracies"])
+        recent.append(entry)
+    return list(recent), node_ids
+
+def window_df(df):
+    """Frame counterpart of window_ledger."""
+    return df.tail(LEDGER_WINDOW)
+
+def index_by_round(df):
+    """Sorts by round and indexes on it, keeping round as a column as well."""
+    return df.sort_values("round").set_index("round", drop=False)
+
+def compact_strings(df):
+    """Moves the string columns into Arrow buffers.
+
+    Hashes are unique per round, so they become plain Arrow strings; the
+    repetitive notes become a categorical over Arrow strings.
+    """
+    for col in ("ipfs_hash", "block_tx"):
+        df[col] = df[col].astype("string[pyarrow]")
+    df["notes"] = df["notes"].astype("string[pyarrow]").astype("category")
+    return df
+
+def node_columns(node_ids):
+    """Maps each node UUID to its Store_A, Store_B, ... column, by sorted UUID."""
+    return {k: f"Store_{chr(65 + i)}" for i, k in enumerate(sorted(node_ids))}
+
+def relabel_nodes(df, node_ids):
+    """Re-letters a frame for the node set `node_ids`, e.g. after a new node joined."""
+    old_cols, new_cols = node_columns(df.attrs.get("node_ids", ())), node_columns(node_ids)
+    df = df.rename(columns={col: new_cols[k] for k, col in old_cols.items()})
+    df.attrs["node_ids"] = tuple(sorted(node_ids))
+    return df
+
+def order_node_columns(df, node_ids):
+    """Puts the Store_* columns back in letter order and records `node_ids`."""
+    store_cols = sorted(col for col in df.columns if col.startswith('Store_'))
+    df = df[[col for col in df.columns if not col.startswith('Store_')] + store_cols]
+    df.attrs["node_ids"] = tuple(sorted(node_ids))
+    return df
+
+def _naive_timestamp(value):
+    """Parses one ISO 8601 timestamp as written, dropping any offset; NaT if it doesn't parse."""
+    try:
+        ts = pd.Timestamp(value)
+    except (ValueError, TypeError):
+        return pd.NaT
+    return ts if ts.tzinfo is None else ts.tz_localize(None)
+
+def parse_timestamps(timestamps):
+    """Parses ISO 8601 timestamps into a naive column; bad or empty ones become NaT.
+
+    The aggregator writes naive local times, so every value keeps the
+    wall-clock time it was written with: an offset, where one is present,
+    is dropped rather than converted.
+    """
+    try:
+        parsed = pd.to_datetime(timestamps, format="ISO8601", errors="coerce", cache=True)
+    except ValueError:
+        # pandas 3 raises on mixed offsets
+        parsed = None
+    if isinstance(parsed, pd.DatetimeIndex):
+        return parsed if parsed.tz is None else parsed.tz_localize(None)
+    # Mixed offsets (pandas 2 returns an object Index): parse value by value
+    return pd.DatetimeIndex([_naive_timestamp(t) for t in timestamps])
+
+def ledger_to_df(ledger, node_ids=()):
+    """Builds the ledger frame, naming node columns Store_A, Store_B, ...
+
+    Letters are assigned by sorted UUID over `node_ids` (every node in the
+    ledger, not just these entries) plus any node in `ledger`. The sorted
+    UUIDs are kept in df.attrs["node_ids"].
+    """
     if not ledger:
         return pd.DataFrame()
-    
-    rows = []
-    for entry in ledger:
-        row = {
-            "round": entry["round"],
-            "timestamp": entry["timestamp"],
-            "global_accuracy": entry["global_accuracy"],
-            "ipfs_hash": entry["ipfs_hash"],
-            "block_tx": entry["block_tx"],
-            "notes": entry.get("notes", ""),
-        }
-        prefixed_node_accuracies = {f"Store_{k}": v for k, v in entry["node_accuracies"].items()}
-        row.update(prefixed_node_accuracies)
-        rows.append(row)
-    
-    df = pd.DataFrame(rows)
-    return df.sort_values("round").reset_index(drop=True)
 
-@st.cache_data(ttl=1) # Reduce TTL for more 'live' feel
+    # Build one list per column in a single pass instead of a dict per row
+    n = len(ledger)
+    rounds, timestamps, accuracies, ipfs_hashes, block_txs, notes = [], [], [], [], [], []
+    node_cols = {}
+    for i, entry in enumerate(ledger):
+        rounds.append(entry["round"])
+        timestamps.append(entry["timestamp"])
+        accuracies.append(entry["global_accuracy"])
+        ipfs_hashes.append(entry["ipfs_hash"])
+        block_txs.append(entry["block_tx"])
+        # Notes repeat across rounds, so keep a single copy of each string
+        notes.append(sys.intern(entry.get("notes") or ""))
+        for k, v in entry["node_accuracies"].items():
+            col = node_cols.get(k)
+            if col is None:
+                # Nodes missing from a round stay NaN
+                col = node_cols[k] = [float("nan")] * n
+            col[i] = v
+
+    order = tuple(sorted({*node_ids, *node_cols}))
+    col_names = node_columns(order)
+    df = pd.DataFrame({
+        "round": rounds,
+        "timestamp": parse_timestamps(timestamps),
+        "global_accuracy": accuracies,
+        "ipfs_hash": ipfs_hashes,
+        "block_tx": block_txs,
+        "notes": notes,
+        **{col_names[k]: node_cols[k] for k in order if k in node_cols},
+    }, copy=False)
+    df.attrs["node_ids"] = order
+    return compact_strings(index_by_round(df))
+
+def _is_json_lines():
+    """True if the ledger holds one JSON record per line rather than a JSON array."""
+    with open(LEDGER, 'rb') as f:
+        head = f.read(64).lstrip()
+    return bool(head) and not head.startswith(b'[')
+
+def load_ledger_increment(offset):
+    """Parses the JSON-lines records appended after byte `offset`.
+
+    Returns the new entries (windowed), every node UUID they mention and the
+    offset to resume from. A last line without a trailing newline counts
+    only if it parses; a record still being written cannot, so it is left
+    for the next call.
+    """
+    consumed = 0
+
+    def records(f):
+        nonlocal consumed
+        for line in f:
+            start = offset + consumed
+            if not line.strip():
+                consumed += len(line)
+                continue
+            try:
+                record = orjson.loads(line)
+            except orjson.JSONDecodeError as e:
+                if not line.endswith(b'\n'):
+                    break
+                # Skip the record rather than failing on it every tick
+                consumed += len(line)
+                logging.warning(f"Skipping malformed ledger line at byte {start}: {e}")
+                continue
+            consumed += len(line)
+            yield record
+
+    with open(LEDGER, 'rb') as f:
+        f.seek(offset)
+        entries, node_ids = window_ledger(records(f))
+    return entries, node_ids, offset + consumed
+
+class LedgerView(NamedTuple):
+    """The ledger frame plus the column projections the dashboard needs."""
+    df: pd.DataFrame
+    store_cols: tuple
+    source: tuple  # (mtime_ns, size) of the ledger file the frame was parsed from
+
+def ledger_view(df, source):
+    """Collects the Store_A, Store_B, ... node columns of `df`."""
+    return LedgerView(df, tuple(col for col in df.columns if col.startswith('Store_')), source)
+
+@st.cache_resource
+def _ledger_cache():
+    """Parsed ledger shared across reruns, keyed on the file's (mtime, size)."""
+    return {"lock": threading.Lock(), "mtime": None, "size": 0, "format": None, "offset": 0,
+            "df": pd.DataFrame(), "view": ledger_view(pd.DataFrame(), (None, 0))}
+
 def get_cached_data():
-    ledger = load_ledger()
-    return ledger_to_df(ledger)
+    """Returns the ledger LedgerView, only parsing what changed since the last call.
+
+    A JSON-lines ledger that grew is read from the last offset and the new
+    rounds are appended to the cached frame. Anything else (a JSON array, a
+    ledger that shrank or changed format, the first call) takes the full
+    parse.
+    """
+    cache = _ledger_cache()
+    with cache["lock"]:
+        try:
+            stat = LEDGER.stat()
+        except FileNotFoundError:
+            stat = None
+        key = (stat.st_mtime_ns, stat.st_size) if stat else (None, 0)
+        if key == (cache["mtime"], cache["size"]):
+            return cache["view"]
+
+        try:
+            json_lines = stat is not None and _is_json_lines()
+        except FileNotFoundError:
+            json_lines = False
+
+        fmt = "jsonl" if json_lines else "json"
+        try:
+            if fmt == "jsonl" and cache["format"] == "jsonl" and key[1] >= cache["size"]:
+                new_entries, new_ids, offset = load_ledger_increment(cache["offset"])
+                if new_entries:
+                    new_df = ledger_to_df(new_entries, {*cache["df"].attrs.get("node_ids", ()), *new_ids})
+                    node_ids = new_df.attrs["node_ids"]
+                    if cache["df"].empty:
+                        # Already windowed, indexed by round and compacted
+                        cache["df"] = new_df
+                    else:
+                        # A new node shifts letters; match what a full parse would give
+                        old_df = relabel_nodes(cache["df"], node_ids)
+                        df = order_node_columns(pd.concat([old_df, new_df], ignore_index=True), node_ids)
+                        cache["df"] = compact_strings(window_df(index_by_round(df)))
+            elif fmt == "jsonl":
+                entries, node_ids, offset = load_ledger_increment(0)
+                cache["df"] = ledger_to_df(entries, node_ids)
+            else:
+                offset = 0
+                cache["df"] = ledger_to_df(*window_ledger(load_ledger()))
+            # Only advance once the frame is built, so a failed tick rereads the records
+            cache["offset"] = offset
+        except FileNotFoundError:
+            # Removed between stat() and open(); retry on the next tick
+            logging.warning("Ledger disappeared while reading; keeping the last view")
+            return cache["view"]
+
+        # Column projections are only recomputed when the ledger changed
+        cache["view"] = ledger_view(cache["df"], key)
+        cache["mtime"], cache["size"], cache["format"] = *key, fmt
+        return cache["view"]
 
 # Sidebar controls
 #with st.sidebar:
@@ -138,56 +362,81 @@ def get_cached_data():
     #rounds_to_show = st.slider("Recent Rounds", 10, 100, 30)
     
 # --- Dashboard Rendering ---
-def render_dashboard_content(df, rounds_to_show):
+def _ledger_view_key(view):
+    """Cache key for a ledger view: the ledger file's (mtime, size).
+
+    This also catches a round rewritten in place, which leaves the round
+    count and columns unchanged.
+    """
+    return view.source
+
+@st.cache_data(hash_funcs={LedgerView: _ledger_view_key}, max_entries=8)
+def build_display(view, rounds_to_show):
+    """Builds the last N rounds with truncated hashes."""
+    # Truncate hashes for display; assign only copies the replaced columns
+    df_display = view.df.tail(rounds_to_show)
+    return df_display.assign(
+        ipfs_hash=truncate_series(df_display['ipfs_hash']),
+        block_tx=truncate_series(df_display['block_tx']),
+    )
+
+@st.cache_data(hash_funcs={LedgerView: _ledger_view_key}, max_entries=8)
+def styled_tables_html(view, rounds_to_show):
+    """Renders the round details and performance matrix tables to HTML.
+
+    Styler builds the gradient CSS cell by cell in Python, so this only
+    runs when a new round lands, not on every refresh.
+    """
+    # Styler needs a unique index and a round can be recorded twice; the index is hidden anyway
+    df_display = build_display(view, rounds_to_show).reset_index(drop=True)
+
+    display_cols = ["round", "timestamp", "global_accuracy", "ipfs_hash", "block_tx", "notes"]
+    # Escape ledger text (notes, hashes) so it cannot inject markup
+    details = (df_display[display_cols].style
+               .format({"global_accuracy": "{:.2%}"}, escape="html")
+               .background_gradient(subset=["global_accuracy"])
+               .hide(axis="index"))
+    matrix = (df_display.style
+              .format(escape="html")
+              .background_gradient(subset=list(view.store_cols))
+              .hide(axis="index"))
+    return details.to_html(), matrix.to_html()
+
+def kpi_card(label, value, delta=""):
+    """HTML for one KPI card in the metrics grid."""
+    delta_html = f'<div class="kpi-delta">{delta}</div>' if delta else ""
+    return (f'<div class="metric-card"><div class="kpi-label">{label}</div>'
+            f'<div class="kpi-value">{value}</div>{delta_html}</div>')
+
+def render_dashboard_content(view, rounds_to_show):
     """Renders the main dashboard content."""
-    if df.empty:
+    if view.df.empty:
         st.warning("No rounds in ledger yet. Connect or turn on your aggregator.")
         return
 
+    details_html, matrix_html = styled_tables_html(view, rounds_to_show)
+    store_cols = view.store_cols
+
     # Filter the dataframe to show only the last N rounds
-    df = df.tail(rounds_to_show)
-
-    # Create a display-friendly copy with truncated hashes
-    df_display = df.copy()
-    df_display['ipfs_hash'] = df_display['ipfs_hash'].apply(truncate_hash)
-    df_display['block_tx'] = df_display['block_tx'].apply(truncate_hash)
-
-    # Rename Business_UUID columns to Store_A, Store_B, etc.
-    business_cols = [col for col in df_display.columns if col.startswith('Store_')]
-    rename_map = {}
-    for i, col in enumerate(business_cols):
-        rename_map[col] = f"Store_{chr(65 + i)}"
-    df_display = df_display.rename(columns=rename_map)
-
-    # Top KPIs
-    latest = df.iloc[-1]
+    df = view.df.tail(rounds_to_show)
+
+    # Top KPIs, read as scalars rather than materializing a row Series
+    global_acc = df["global_accuracy"].to_numpy()
+    latest_acc = global_acc[-1]
+    prev_acc = global_acc[-2] if global_acc.size > 1 else latest_acc
+    latest_round = int(df["round"].iat[-1])
+    latest_ts = df["timestamp"].iat[-1]
+    delta = (latest_acc - prev_acc) * 100
     st.markdown("### 📊 Key Performance Metrics")
-    col1, col2, col3, col4 = st.columns(4)
-
-    with col1:
-        st.markdown('<div class="metric-card">', unsafe_allow_html=True)
-        st.metric("Current Round", int(latest.get("round", 0)), delta="+1" if not df.empty else "")
-        st.markdown('</div>', unsafe_allow_html=True)
-
-    with col2:
-        st.markdown('<div class="metric-card">', unsafe_allow_html=True)
-        prev_acc = df.iloc[-2]["global_accuracy"] if len(df) > 1 else latest["global_accuracy"]
-        delta = (latest["global_accuracy"] - prev_acc) * 100
-        st.metric("Global Accuracy", f"{latest['global_accuracy']*100:.2f}%", f"{delta:+.2f}%")
-        st.markdown('</div>', unsafe_allow_html=True)
-
-    with col3:
-        st.markdown('<div class="metric-card">', unsafe_allow_html=True)
-        node_columns = [col for col in latest.index if col.startswith('Store_')]
-        st.metric("Active Nodes", len(node_columns))
-        st.markdown('</div>', unsafe_allow_html=True)
-
-    with col4:
-        st.markdown('<div class="metric-card">', unsafe_allow_html=True)
-        st.write("Last Update")
-        timestamp = latest.get("timestamp", "")
-        st.caption(timestamp.split("T")[1].split(".")[0] if "T" in timestamp else timestamp)
-        st.markdown('</div>', unsafe_allow_html=True)
+    # One element for all four cards instead of three per card
+    st.html(
+        '<div class="kpi-grid">'
+        + kpi_card("Current Round", latest_round, "+1")
+        + kpi_card("Global Accuracy", f"{latest_acc*100:.2f}%", f"{delta:+.2f}%")
+        + kpi_card("Active Nodes", len(store_cols))
+        + kpi_card("Last Update", "" if pd.isna(latest_ts) else latest_ts.strftime("%H:%M:%S"))
+        + '</div>'
+    )
 
     # Performance Charts
     st.markdown("### 📈 Performance Analysis")
@@ -207,21 +456,16 @@ def render_dashboard_content(df, rounds_to_show):
 
         with col2:
             st.markdown("#### Node Performance (Round 10)")
-            round_10_data = df[df['round'] == 10]
-            if not round_10_data.empty:
-                round_10_latest = round_10_data.iloc[-1]
-                node_columns = [col for col in round_10_latest.index if col.startswith('Store_')]
-                node_accuracies = {col: round_10_latest.get(col) for col in node_columns}
-
-                # Map UUIDs to simpler names for display
-                node_name_map = {}
-                for i, col in enumerate(node_columns):
-                    node_name_map[col] = f"Store_{chr(65 + i)}"
+            if 10 in df.index:
+                round_10_latest = df.loc[10]
+                if isinstance(round_10_latest, pd.DataFrame):
+                    round_10_latest = round_10_latest.iloc[-1]
+                node_accuracies = {col: round_10_latest.get(col) for col in store_cols}
 
                 performance_data = []
                 for col, acc in node_accuracies.items():
                     if pd.notnull(acc):
-                        performance_data.append({'Node': node_name_map.get(col, col), 'Accuracy': acc})
+                        performance_data.append({'Node': col, 'Accuracy': acc})
 
                 performance_df = pd.DataFrame(performance_data)
                 if not performance_df.empty:
@@ -233,22 +477,14 @@ def render_dashboard_content(df, rounds_to_show):
 
     with tab2:
         st.markdown("#### Detailed Round Information")
-        display_cols = ["round", "timestamp", "global_accuracy", "ipfs_hash", "block_tx", "notes"]
-        st.dataframe(
-            df_display[display_cols].style.format({"global_accuracy": "{:.2%}"}).background_gradient(subset=["global_accuracy"]),
-            height=300
-        )
+        st.html(f'<div style="max-height: 300px; overflow: auto;">{details_html}</div>')
 
     # Node Analysis
     st.markdown("### 🔍 Node Analysis")
     node_tab1, node_tab2 = st.tabs(["📊 Performance Matrix", "🔗 Blockchain Info"])
 
     with node_tab1:
-        node_columns = [col for col in df_display.columns if col.startswith('Store_')]
-        st.dataframe(
-            df_display.style.background_gradient(subset=node_columns),
-            height=260
-        )
+        st.html(f'<div style="max-height: 260px; overflow: auto;">{matrix_html}</div>')
 
     with node_tab2:
 
@@ -262,19 +498,12 @@ def render_dashboard_content(df, rounds_to_show):
                 st.write("No transaction recorded for this round.")
 
 # --- Main App Logic ---
-placeholder = st.empty()
-
 rounds_to_show = 10
 
-# Initial render
-df = get_cached_data()
-with placeholder.container():
-    render_dashboard_content(df, rounds_to_show)
-
-# Live update loop
-if st.session_state.auto_refresh:
-    while True:
-        time.sleep(5) # Refresh interval
-        df = get_cached_data()
-        with placeholder.container():
-            render_dashboard_content(df, rounds_to_show)
+@st.fragment(run_every=REFRESH_INTERVAL if st.session_state.auto_refresh else None)
+def live_panel():
+    """Reruns only the dashboard content on each refresh, not the whole script."""
+    view = get_cached_data()
+    render_dashboard_content(view, rounds_to_show)
+
+live_panel()